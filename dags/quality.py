@@ -2,6 +2,14 @@ from airflow import DAG
 from airflow.operators.python import PythonOperator
 from datetime import datetime, timedelta
 from scripts.transform import transform_quality_data
+from psycopg2.extras import execute_values
+from pyarrow import csv as pacsv
+from sqlalchemy import create_engine, text
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import functools
+import io
 import os
 import logging
 
@@ -13,6 +21,76 @@ RAW_FILE = os.path.join(BASE_DIR, "calidad_agua.csv")
 TRANSFORMED_FILE_CSV = os.path.join(BASE_DIR, "calidad_agua_clean.csv")
 TRANSFORMED_FILE_PARQUET = os.path.join(BASE_DIR, "calidad_agua_clean.parquet")
 
+# Tipos explícitos del CSV crudo de CONAGUA (etiquetas de baja cardinalidad como diccionario)
+LABEL_TYPE = pa.dictionary(pa.int32(), pa.string())
+RAW_COLUMN_TYPES = {
+    'ORGANISMO_DE_CUENCA': LABEL_TYPE,
+    'ESTADO': LABEL_TYPE,
+    'TIPO': LABEL_TYPE,
+    'SUBTIPO': LABEL_TYPE,
+    'LONGITUD': pa.float64(),
+    'LATITUD': pa.float64(),
+    'PERIODO': LABEL_TYPE,
+    'CALIDAD_DBO': LABEL_TYPE,
+    'CALIDAD_DQO': LABEL_TYPE,
+    'CALIDAD_SST': LABEL_TYPE,
+    'SEMAFORO': LABEL_TYPE,
+}
+
+# Columnas cargadas a water_data.calidad_agua_clean (esquema de init-db.sql)
+LOAD_COLUMNS = [
+    'clave_sitio', 'sitio', 'organismo_de_cuenca', 'estado', 'municipio', 'cuenca',
+    'cuerpo_de_agua', 'tipo', 'subtipo', 'longitud', 'latitud', 'periodo',
+    'dbo_mg/l', 'calidad_dbo', 'dqo_mg/l', 'calidad_dqo', 'sst_mg/l', 'calidad_sst',
+    'semaforo', 'contaminantes',
+    'indice_calidad_dqo', 'indice_calidad_dbo', 'indice_calidad_sst',
+    'indice_calidad_general', 'semaforo_numerico'
+]
+
+# Vistas materializadas de análisis (se recrean en cada carga)
+ANALYSIS_VIEWS_SQL = """
+    CREATE MATERIALIZED VIEW water_data.resumen_por_estado AS
+    SELECT 
+        estado,
+        COUNT(*) as total_sitios,
+        AVG(indice_calidad_general) as calidad_promedio,
+        COUNT(CASE WHEN semaforo = 'VERDE' THEN 1 END) as sitios_verdes,
+        COUNT(CASE WHEN semaforo = 'AMARILLO' THEN 1 END) as sitios_amarillos,
+        COUNT(CASE WHEN semaforo = 'ROJO' THEN 1 END) as sitios_rojos
+    FROM water_data.calidad_agua_clean
+    GROUP BY estado
+    ORDER BY calidad_promedio DESC;
+
+    CREATE MATERIALIZED VIEW water_data.calidad_por_periodo AS
+    SELECT 
+        periodo,
+        estado,
+        COUNT(*) as mediciones,
+        AVG(indice_calidad_general) as calidad_promedio,
+        MIN(indice_calidad_general) as calidad_minima,
+        MAX(indice_calidad_general) as calidad_maxima
+    FROM water_data.calidad_agua_clean
+    GROUP BY periodo, estado
+    ORDER BY periodo DESC, estado;
+
+    CREATE INDEX idx_resumen_estado ON water_data.resumen_por_estado (estado);
+    CREATE INDEX idx_periodo_estado ON water_data.calidad_por_periodo (periodo, estado);
+"""
+
+# Tabla de staging para la carga masiva
+STAGING_TABLE = 'calidad_agua_clean_new'
+
+# Reemplazo de la tabla final por la de staging (publicada como LOGGED); los índices se crean ya con los datos cargados
+SWAP_TABLE_SQL = f"""
+    DROP TABLE IF EXISTS water_data.calidad_agua_clean CASCADE;
+    ALTER TABLE water_data.{STAGING_TABLE} RENAME TO calidad_agua_clean;
+    ALTER TABLE water_data.calidad_agua_clean SET LOGGED;
+    CREATE INDEX idx_estado ON water_data.calidad_agua_clean (estado);
+    CREATE INDEX idx_semaforo ON water_data.calidad_agua_clean (semaforo);
+    CREATE INDEX idx_organismo ON water_data.calidad_agua_clean (organismo_de_cuenca);
+    CREATE INDEX idx_fecha_carga ON water_data.calidad_agua_clean (fecha_carga);
+"""
+
 # Configuración de la base de datos
 WATER_DB_CONFIG = {
     'host': os.getenv('WATER_DB_HOST', 'postgres-waterdb'),
@@ -22,6 +100,9 @@ WATER_DB_CONFIG = {
     'password': os.getenv('WATER_DB_PASSWORD', 'waterpass')
 }
 
+# Método de carga: 'copy' (COPY FROM STDIN) o 'values' (execute_values como respaldo)
+WATER_DB_LOAD_METHOD = os.getenv('WATER_DB_LOAD_METHOD', 'copy')
+
 def notify_failure(context):
     task_instance = context['task_instance']
     exception = context.get('exception')
@@ -29,6 +110,63 @@ def notify_failure(context):
     logger.error(f"🔴 Error: {exception}")
     print(f"🚨 NOTIFICACIÓN: Tarea {task_instance.task_id} falló")
 
+@functools.lru_cache(maxsize=4)
+def get_engine(connection_string):
+    """
+    Devuelve un engine de SQLAlchemy reutilizable por proceso (pool de conexiones compartido)
+    """
+    return create_engine(
+        connection_string,
+        executemany_mode='values_plus_batch',
+        pool_pre_ping=True,
+        pool_size=4,
+        future=True
+    )
+
+def copy_dataframe_to_postgres(df, engine, table, schema):
+    """
+    Carga un DataFrame en una tabla existente de PostgreSQL usando COPY FROM STDIN.
+    Devuelve el número de filas copiadas reportado por PostgreSQL.
+    """
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=True)
+    buffer.seek(0)
+
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cur:
+            cur.copy_expert(
+                f"COPY {schema}.{table} FROM STDIN WITH (FORMAT CSV, HEADER TRUE)",
+                buffer
+            )
+            rowcount = cur.rowcount
+        raw_conn.commit()
+    finally:
+        raw_conn.close()
+    return rowcount
+
+def psql_insert_values(table, conn, keys, data_iter):
+    """
+    Método de inserción para DataFrame.to_sql usando psycopg2.extras.execute_values.
+    Devuelve el número de filas insertadas reportado por PostgreSQL.
+    """
+    rows = list(data_iter)
+    table_name = f"{table.schema}.{table.name}" if table.schema else table.name
+    columns = ", ".join(f'"{key}"' for key in keys)
+    page_size = 5000
+    inserted = 0
+    with conn.connection.cursor() as cur:
+        # Una página por llamada: cur.rowcount solo refleja el último INSERT ejecutado
+        for start in range(0, len(rows), page_size):
+            execute_values(
+                cur,
+                f"INSERT INTO {table_name} ({columns}) VALUES %s",
+                rows[start:start + page_size],
+                page_size=page_size
+            )
+            inserted += cur.rowcount
+    return inserted
+
 default_args = {
     "owner": "gerardo",
     "depends_on_past": False,
@@ -67,36 +205,46 @@ with DAG(
         try:
             logger.info("🔄 Iniciando transformación...")
             
-            import pandas as pd
-            
-            file_size = os.path.getsize(RAW_FILE)
-            
-            # SCALING CONSIDERATION: Chunks para archivos grandes
-            if file_size > 5 * 1024 * 1024:
-                logger.info(f"⚙️ ESCALABILIDAD: Archivo grande ({file_size:,} bytes)")
-                logger.info("📦 Procesando en chunks...")
-                
-                chunk_size = 10000
-                chunks = []
-                for i, chunk in enumerate(pd.read_csv(RAW_FILE, chunksize=chunk_size), 1):
-                    chunks.append(chunk)
-                df = pd.concat(chunks, ignore_index=True)
-                logger.info(f"✅ {len(df):,} registros procesados")
-            else:
-                logger.info("⚡ Procesamiento directo")
-                df = pd.read_csv(RAW_FILE)
+            # Lectura única con el parser multihilo de pyarrow (columnas respaldadas por Arrow)
+            table = pacsv.read_csv(
+                RAW_FILE,
+                read_options=pacsv.ReadOptions(block_size=16 << 20, use_threads=True),
+                convert_options=pacsv.ConvertOptions(
+                    column_types=RAW_COLUMN_TYPES,
+                    strings_can_be_null=True
+                )
+            )
+            # Columnas vacías como float64 (igual que pandas) en lugar del tipo null de Arrow
+            schema = pa.schema([
+                pa.field(field.name, pa.float64()) if pa.types.is_null(field.type) else field
+                for field in table.schema
+            ])
+            # Diccionarios -> pandas Categorical; el resto respaldado por Arrow
+            df = table.cast(schema).to_pandas(
+                types_mapper=lambda t: None if pa.types.is_dictionary(t) else pd.ArrowDtype(t)
+            )
+            logger.info(f"✅ {len(df):,} registros leídos")
             
-            temp_file = RAW_FILE + ".temp"
-            df.to_csv(temp_file, index=False)
+            df = transform_quality_data(df)
             
-            transform_quality_data(temp_file, TRANSFORMED_FILE_CSV)
+            # Una sola conversión a Arrow (los Categorical se conservan como diccionarios)
+            table = pa.Table.from_pandas(df, preserve_index=False)
             
-            # SCALING: Formato Parquet
-            df_transformed = pd.read_csv(TRANSFORMED_FILE_CSV)
-            df_transformed.to_parquet(TRANSFORMED_FILE_PARQUET, index=False, compression='snappy')
+            # SCALING: Formato Parquet (zstd, diccionarios y estadísticas por row group)
+            pq.write_table(
+                table,
+                TRANSFORMED_FILE_PARQUET,
+                compression='zstd',
+                compression_level=3,
+                row_group_size=128_000,
+                use_dictionary=True,
+                write_statistics=True,
+                data_page_size=1 << 20
+            )
             logger.info("✅ Formato Parquet generado")
             
-            os.remove(temp_file)
+            # CSV limpio para consumidores externos (reporte)
+            pacsv.write_csv(table, TRANSFORMED_FILE_CSV)
             logger.info("✅ Transformación completada")
             
         except Exception as e:
@@ -107,10 +255,10 @@ with DAG(
         try:
             logger.info("📊 Iniciando carga a base de datos...")
             
-            import pandas as pd
-            from sqlalchemy import create_engine, text
-            
-            df = pd.read_parquet(TRANSFORMED_FILE_PARQUET)
+            # Leer solo las columnas que se cargan (proyección de columnas en Parquet)
+            available = set(pq.read_schema(TRANSFORMED_FILE_PARQUET).names)
+            columns = [c for c in LOAD_COLUMNS if c in available]
+            df = pd.read_parquet(TRANSFORMED_FILE_PARQUET, columns=columns, engine='pyarrow', use_threads=True)
             logger.info(f"✅ Datos leídos: {len(df):,} registros")
             
             connection_string = (
@@ -119,7 +267,7 @@ with DAG(
             )
             
             logger.info(f"🔌 Conectando a {WATER_DB_CONFIG['host']}:{WATER_DB_CONFIG['port']}")
-            engine = create_engine(connection_string)
+            engine = get_engine(connection_string)
             
             # Verificar conexión
             with engine.connect() as conn:
@@ -127,85 +275,53 @@ with DAG(
                 version = result.fetchone()[0]
                 logger.info(f"✅ Conexión exitosa: {version[:50]}...")
             
-            # Preparar datos
-            df_to_load = df.copy()
-            df_to_load['fecha_carga'] = datetime.now()
+            # Preparar datos (columna constante, sin copiar el DataFrame)
+            df['fecha_carga'] = pd.Timestamp.now()
             
-            # Eliminar vistas antes de reemplazar tabla (para evitar conflicto)
-            logger.info("🗑️ Preparando base de datos...")
+            # Tabla de staging UNLOGGED (sin WAL durante la carga masiva), con el esquema inferido por pandas
+            logger.info("🗑️ Preparando tabla de staging...")
+            staging_ddl = pd.io.sql.get_schema(df, STAGING_TABLE, schema='water_data', con=engine)
+            staging_ddl = staging_ddl.replace("CREATE TABLE", "CREATE UNLOGGED TABLE", 1)
             with engine.begin() as conn:
-                conn.execute(text("DROP VIEW IF EXISTS water_data.resumen_por_estado CASCADE;"))
-                conn.execute(text("DROP VIEW IF EXISTS water_data.calidad_por_periodo CASCADE;"))
-            
-            # Cargar datos (replace ahora funcionará)
-            logger.info("💾 Insertando datos en water_data.calidad_agua_clean...")
-            df_to_load.to_sql(
-                name='calidad_agua_clean',
-                schema='water_data',
-                con=engine,
-                if_exists='replace',
-                index=False,
-                method='multi',
-                chunksize=1000
-            )
+                conn.execute(text(f"DROP TABLE IF EXISTS water_data.{STAGING_TABLE};\n{staging_ddl}"))
+            
+            logger.info(f"💾 Insertando datos en water_data.{STAGING_TABLE}...")
+            if WATER_DB_LOAD_METHOD == 'values':
+                loaded = df.to_sql(
+                    name=STAGING_TABLE,
+                    schema='water_data',
+                    con=engine,
+                    if_exists='append',
+                    index=False,
+                    method=psql_insert_values
+                )
+            else:
+                loaded = copy_dataframe_to_postgres(df, engine, STAGING_TABLE, 'water_data')
             
-            # Recrear vistas después de cargar datos
-            logger.info("📊 Recreando vistas de análisis...")
+            # Verificar carga contra el conteo del footer de Parquet antes de publicar la tabla
+            expected = pq.ParquetFile(TRANSFORMED_FILE_PARQUET).metadata.num_rows
+            if loaded != expected:
+                raise ValueError(f"Carga incompleta: {loaded:,} filas cargadas, {expected:,} esperadas")
+            logger.info(f"✅ Filas cargadas verificadas: {loaded:,}")
+            
+            # Reemplazar tabla y recrear vistas materializadas en una sola transacción
+            logger.info("📊 Publicando tabla y recreando vistas materializadas de análisis...")
             with engine.begin() as conn:
-                # Vista de resumen por estado
-                conn.execute(text("""
-                    CREATE VIEW water_data.resumen_por_estado AS
-                    SELECT 
-                        estado,
-                        COUNT(*) as total_sitios,
-                        AVG(indice_calidad_general) as calidad_promedio,
-                        COUNT(CASE WHEN semaforo = 'VERDE' THEN 1 END) as sitios_verdes,
-                        COUNT(CASE WHEN semaforo = 'AMARILLO' THEN 1 END) as sitios_amarillos,
-                        COUNT(CASE WHEN semaforo = 'ROJO' THEN 1 END) as sitios_rojos
-                    FROM water_data.calidad_agua_clean
-                    GROUP BY estado
-                    ORDER BY calidad_promedio DESC;
-                """))
-                
-                # Vista de calidad por periodo
-                conn.execute(text("""
-                    CREATE VIEW water_data.calidad_por_periodo AS
-                    SELECT 
-                        periodo,
-                        estado,
-                        COUNT(*) as mediciones,
-                        AVG(indice_calidad_general) as calidad_promedio,
-                        MIN(indice_calidad_general) as calidad_minima,
-                        MAX(indice_calidad_general) as calidad_maxima
-                    FROM water_data.calidad_agua_clean
-                    GROUP BY periodo, estado
-                    ORDER BY periodo DESC, estado;
-                """))
-            
-            # Verificar carga
-            with engine.connect() as conn:
-                result = conn.execute(text("SELECT COUNT(*) FROM water_data.calidad_agua_clean"))
-                count = result.fetchone()[0]
-                logger.info(f"✅ Registros en BD: {count:,}")
-                
-                if 'semaforo' in df.columns:
-                    stats_query = """
-                    SELECT semaforo, COUNT(*) as total 
-                    FROM water_data.calidad_agua_clean 
-                    GROUP BY semaforo
-                    ORDER BY total DESC
-                    """
-                    result = conn.execute(text(stats_query))
-                    logger.info("\n🚦 Distribución por semáforo:")
-                    for row in result:
-                        logger.info(f"   {row[0]}: {row[1]:,}")
+                # Reemplazo, índices y vistas en un solo envío (una ida y vuelta a PostgreSQL)
+                conn.execute(text(SWAP_TABLE_SQL + ANALYSIS_VIEWS_SQL))
+            
+            # Resumen de carga calculado en memoria (sin volver a consultar la tabla)
+            if 'semaforo' in df.columns:
+                logger.info("\n🚦 Distribución por semáforo:")
+                for semaforo, total in df['semaforo'].value_counts().to_dict().items():
+                    logger.info(f"   {semaforo}: {total:,}")
             
             logger.info("="*60)
             logger.info("✅ CARGA COMPLETADA EXITOSAMENTE")
             logger.info(f"✓ Base de datos: {WATER_DB_CONFIG['database']}")
             logger.info(f"✓ Tabla: water_data.calidad_agua_clean")
             logger.info(f"✓ Registros: {len(df):,}")
-            logger.info(f"✓ Vistas recreadas: 2")
+            logger.info(f"✓ Vistas materializadas recreadas: 2")
             logger.info("="*60)
             
         except Exception as e:
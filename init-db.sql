@@ -4,9 +4,7 @@
 -- Crear esquema para los datos
 CREATE SCHEMA IF NOT EXISTS water_data;
 
--- Eliminar tabla y vistas si existen (para re-inicialización limpia)
-DROP VIEW IF EXISTS water_data.calidad_por_periodo CASCADE;
-DROP VIEW IF EXISTS water_data.resumen_por_estado CASCADE;
+-- Eliminar tabla y vistas dependientes si existen (para re-inicialización limpia)
 DROP TABLE IF EXISTS water_data.calidad_agua_clean CASCADE;
 
 -- Crear tabla para datos limpios de calidad del agua
@@ -49,8 +47,8 @@ CREATE INDEX IF NOT EXISTS idx_semaforo ON water_data.calidad_agua_clean(semafor
 CREATE INDEX IF NOT EXISTS idx_organismo ON water_data.calidad_agua_clean(organismo_de_cuenca);
 CREATE INDEX IF NOT EXISTS idx_fecha_carga ON water_data.calidad_agua_clean(fecha_carga);
 
--- Crear vista para análisis rápido
-CREATE OR REPLACE VIEW water_data.resumen_por_estado AS
+-- Crear vista materializada para análisis rápido
+CREATE MATERIALIZED VIEW IF NOT EXISTS water_data.resumen_por_estado AS
 SELECT 
     estado,
     COUNT(*) as total_sitios,
@@ -62,8 +60,8 @@ FROM water_data.calidad_agua_clean
 GROUP BY estado
 ORDER BY calidad_promedio DESC;
 
--- Crear vista para análisis temporal
-CREATE OR REPLACE VIEW water_data.calidad_por_periodo AS
+-- Crear vista materializada para análisis temporal
+CREATE MATERIALIZED VIEW IF NOT EXISTS water_data.calidad_por_periodo AS
 SELECT 
     periodo,
     estado,
@@ -75,6 +73,9 @@ FROM water_data.calidad_agua_clean
 GROUP BY periodo, estado
 ORDER BY periodo DESC, estado;
 
+CREATE INDEX IF NOT EXISTS idx_resumen_estado ON water_data.resumen_por_estado(estado);
+CREATE INDEX IF NOT EXISTS idx_periodo_estado ON water_data.calidad_por_periodo(periodo, estado);
+
 -- Otorgar permisos
 GRANT ALL PRIVILEGES ON SCHEMA water_data TO wateruser;
 GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA water_data TO wateruser;
@@ -1,11 +1,18 @@
+import numpy as np
 import pandas as pd
 
-def transform_quality_data(input_path: str, output_path: str):
+def quality_index(series: pd.Series, levels: list) -> pd.Series:
+    """
+    Convierte una columna de calidad en su índice numérico (1..N) usando códigos categóricos
+    """
+    codes = pd.Categorical(series, categories=levels).codes.astype('int8')
+    # Código -1 = valor fuera de los niveles conocidos -> NA
+    return pd.Series(pd.arrays.IntegerArray(codes + 1, mask=codes < 0), index=series.index)
+
+def transform_quality_data(df: pd.DataFrame) -> pd.DataFrame:
     """
     Transforma datos de calidad del agua del monitoreo de CONAGUA
     """
-    df = pd.read_csv(input_path)
-    
     print(f"📊 Datos cargados: {len(df)} registros")
     print(f"📋 Columnas originales: {len(df.columns)}")
     
@@ -16,63 +23,67 @@ def transform_quality_data(input_path: str, output_path: str):
     # Estandarizar nombres de columnas
     df.columns = [c.strip().replace(" ", "_").lower() for c in df.columns]
     
-    # Rellenar valores nulos
-    df.fillna(0, inplace=True)
-    
-    # Mapeo de calidad del agua según los valores reales del CSV
+    # Niveles de calidad del agua según los valores reales del CSV (índice = posición + 1)
     # Valores encontrados: "Excelente", "Buena calidad", "Aceptable", "Contaminada"
-    quality_map = {
-        "Excelente": 1, 
-        "Buena calidad": 2, 
-        "Aceptable": 3, 
-        "Contaminada": 4
+    quality_levels = ["Excelente", "Buena calidad", "Aceptable", "Contaminada"]
+    
+    # Columnas origen de cada índice de calidad
+    quality_sources = {
+        'indice_calidad_dqo': 'calidad_dqo',  # Demanda Química de Oxígeno
+        'indice_calidad_dbo': 'calidad_dbo',  # Demanda Bioquímica de Oxígeno
+        'indice_calidad_sst': 'calidad_sst',  # Sólidos Suspendidos Totales
     }
     
-    # Crear índice de calidad basado en DQO (Demanda Química de Oxígeno)
+    # Crear todos los índices de calidad como un solo bloque numérico
+    idx = pd.DataFrame(
+        {
+            indice: quality_index(df[source], quality_levels)
+            for indice, source in quality_sources.items()
+            if source in df.columns
+        },
+        index=df.index,
+    )
+    df = pd.concat([df, idx], axis=1)
+    indice_columns = list(idx.columns)
+    for indice in indice_columns:
+        print(f"✓ Índice de calidad {indice.split('_')[-1].upper()} creado")
+    
     if 'calidad_dqo' in df.columns:
-        df['indice_calidad_dqo'] = df['calidad_dqo'].map(quality_map)
-        print(f"✓ Índice de calidad DQO creado")
-        
         # Mostrar distribución
         print("\n📈 Distribución de calidad DQO:")
         print(df['calidad_dqo'].value_counts())
     else:
         print("⚠ Advertencia: Columna 'calidad_dqo' no encontrada")
     
-    # Crear índice de calidad basado en DBO (Demanda Bioquímica de Oxígeno)
-    if 'calidad_dbo' in df.columns:
-        df['indice_calidad_dbo'] = df['calidad_dbo'].map(quality_map)
-        print(f"✓ Índice de calidad DBO creado")
-    
-    # Crear índice de calidad basado en SST (Sólidos Suspendidos Totales)
-    if 'calidad_sst' in df.columns:
-        df['indice_calidad_sst'] = df['calidad_sst'].map(quality_map)
-        print(f"✓ Índice de calidad SST creado")
-    
     # Crear un índice de calidad general (promedio de los índices disponibles)
-    indice_columns = [col for col in df.columns if col.startswith('indice_calidad_')]
     if indice_columns:
-        df['indice_calidad_general'] = df[indice_columns].mean(axis=1).round(2)
+        # Solo filas con al menos un índice válido; el resto queda como NA
+        valores = idx.to_numpy(dtype='float32', na_value=np.nan)
+        validos = ~np.isnan(valores).all(axis=1)
+        general = np.full(len(df), np.nan, dtype='float32')
+        general[validos] = np.nanmean(valores[validos], axis=1)
+        # float32 solo para la reducción; se publica en float64 para que los 2 decimales sean exactos
+        df['indice_calidad_general'] = np.round(general.astype('float64'), 2)
         print(f"✓ Índice de calidad general creado (promedio de {len(indice_columns)} índices)")
     
     # Agregar categoría de semáforo como numérica
     semaforo_map = {"VERDE": 1, "AMARILLO": 2, "ROJO": 3}
     if 'semaforo' in df.columns:
-        df['semaforo_numerico'] = df['semaforo'].map(semaforo_map)
+        df['semaforo_numerico'] = df['semaforo'].map(semaforo_map).astype('Int8')
         print(f"✓ Semáforo convertido a numérico")
         print("\n🚦 Distribución de semáforo:")
         print(df['semaforo'].value_counts())
     
-    # Guardar archivo transformado
-    df.to_csv(output_path, index=False)
-    print(f"\n✅ Datos transformados guardados en: {output_path}")
+    print(f"\n✅ Datos transformados")
     print(f"✅ Total de registros: {len(df)}")
     print(f"✅ Total de columnas: {len(df.columns)}")
     
     # Mostrar resumen estadístico
     print("\n📊 Resumen de índices de calidad:")
-    for col in indice_columns + ['indice_calidad_general']:
-        if col in df.columns:
-            print(f"{col}: media={df[col].mean():.2f}, min={df[col].min()}, max={df[col].max()}")
+    stats_columns = indice_columns + ['indice_calidad_general'] if indice_columns else []
+    if stats_columns:
+        stats = df[stats_columns].agg(['mean', 'min', 'max'])
+        for col in stats_columns:
+            print(f"{col}: media={stats.at['mean', col]:.2f}, min={stats.at['min', col]}, max={stats.at['max', col]}")
     
-    return output_path
\ No newline at end of file
+    return df